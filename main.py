@@ -1,7 +1,13 @@
 # music_generator.py
 
+import bisect
+import functools
+import itertools
+import math
 import os
 import random
+import re
+from operator import itemgetter
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
@@ -16,13 +22,13 @@ NOTE_NAME_TO_NUMBER = {
 }
 
 SCALE_INTERVALS = {
-    'Major': [0, 2, 4, 5, 7, 9, 11],
-    'Natural Minor': [0, 2, 3, 5, 7, 8, 10],
-    'Harmonic Minor': [0, 2, 3, 5, 7, 8, 11],
-    'Melodic Minor': [0, 2, 3, 5, 7, 9, 11],
-    'Pentatonic Major': [0, 2, 4, 7, 9],
-    'Pentatonic Minor': [0, 3, 5, 7, 10],
-    'Blues': [0, 3, 5, 6, 7, 10],
+    'Major': (0, 2, 4, 5, 7, 9, 11),
+    'Natural Minor': (0, 2, 3, 5, 7, 8, 10),
+    'Harmonic Minor': (0, 2, 3, 5, 7, 8, 11),
+    'Melodic Minor': (0, 2, 3, 5, 7, 9, 11),
+    'Pentatonic Major': (0, 2, 4, 7, 9),
+    'Pentatonic Minor': (0, 3, 5, 7, 10),
+    'Blues': (0, 3, 5, 6, 7, 10),
 }
 
 INSTRUMENTS = {
@@ -36,6 +42,10 @@ INSTRUMENTS = {
     'Synth Lead': 80,
 }
 
+COMPLEX_RHYTHM_DURATIONS = (0.25, 0.5, 0.75, 1)
+
+MELODY_STEPS = (-2, -1, 1, 2)
+
 CHORD_PROGRESSIONS = {
     'I-IV-V': [1, 4, 5],
     'I-V-vi-IV': [1, 5, 6, 4],
@@ -44,14 +54,35 @@ CHORD_PROGRESSIONS = {
 }
 
 # Utility Functions
+# \w matches str.isalnum() characters plus underscore, so non-ASCII letters and digits are kept.
+_FILENAME_DISALLOWED = re.compile(r'[^\w -]+')
+
 def sanitize_filename(filename):
-    return "".join(c for c in filename if c.isalnum() or c in (' ', '_', '-')).rstrip()
+    return _FILENAME_DISALLOWED.sub('', filename).rstrip()
+
+@functools.lru_cache(maxsize=32)
+def parse_time_signature(time_signature):
+    beats_per_measure, beat_unit = map(int, time_signature.split('/'))
+    return beats_per_measure, beat_unit
 
 def ensure_dir(directory):
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    os.makedirs(directory, exist_ok=True)
 
 # Music Generation Classes
+@functools.lru_cache(maxsize=256)
+def _scale_notes(root_note_name, scale_type, octaves):
+    if root_note_name not in NOTE_NAME_TO_NUMBER:
+        raise ValueError(f"Invalid root note name: {root_note_name}.")
+    if scale_type not in SCALE_INTERVALS:
+        raise ValueError(f"Invalid scale type: {scale_type}.")
+
+    root_note = NOTE_NAME_TO_NUMBER[root_note_name]
+    intervals = SCALE_INTERVALS[scale_type]
+    scale_notes = [root_note + interval + (octave * 12) for octave in range(octaves) for interval in intervals]
+    # MIDI notes fit in a byte; bytes keeps the cached scale compact and immutable.
+    # Every term above is non-negative, so only the top of the MIDI range can be exceeded.
+    return bytes(note_number for note_number in scale_notes if note_number <= 127)
+
 class Scale:
     def __init__(self, root_note_name, scale_type, octaves=5):
         self.root_note_name = root_note_name
@@ -60,84 +91,82 @@ class Scale:
         self.notes = self.generate_scale_notes()
 
     def generate_scale_notes(self):
-        if self.root_note_name not in NOTE_NAME_TO_NUMBER:
-            raise ValueError(f"Invalid root note name: {self.root_note_name}.")
-        if self.scale_type not in SCALE_INTERVALS:
-            raise ValueError(f"Invalid scale type: {self.scale_type}.")
-
-        root_note = NOTE_NAME_TO_NUMBER[self.root_note_name]
-        scale_notes = []
-        for octave in range(self.octaves):
-            for interval in SCALE_INTERVALS[self.scale_type]:
-                note_number = root_note + interval + (octave * 12)
-                if 0 <= note_number <= 127:
-                    scale_notes.append(note_number)
-        return scale_notes
+        # Scales are pure functions of their parameters, so identical requests share one cached result.
+        return _scale_notes(self.root_note_name, self.scale_type, self.octaves)
 
 class RhythmPattern:
-    def __init__(self, length, time_signature, pattern_type='steady', complexity=1):
+    def __init__(self, length, time_signature, pattern_type='steady', complexity=1, rng=None):
         self.length = length
         self.time_signature = time_signature
         self.pattern_type = pattern_type
         self.complexity = complexity
+        self.rng = rng if rng is not None else random
         self.pattern = self.generate_rhythm_pattern()
 
     def generate_rhythm_pattern(self):
-        beats_per_measure, beat_unit = map(int, self.time_signature.split('/'))
+        beats_per_measure, beat_unit = parse_time_signature(self.time_signature)
         total_beats = self.length * beats_per_measure
 
-        if self.pattern_type == 'steady':
-            rhythm_pattern = [1 for _ in range(total_beats)]
-        elif self.pattern_type == 'complex':
+        if self.pattern_type == 'complex':
             rhythm_pattern = self.generate_complex_rhythm(total_beats)
         else:
-            rhythm_pattern = [1 for _ in range(total_beats)]
+            rhythm_pattern = [1] * total_beats
         return rhythm_pattern
 
     def generate_complex_rhythm(self, total_beats):
-        rhythm_pattern = []
-        while total_beats > 0:
-            duration = random.choice([0.25, 0.5, 0.75, 1])
-            if duration <= total_beats:
-                rhythm_pattern.append(duration)
-                total_beats -= duration
-            else:
-                rhythm_pattern.append(total_beats)
-                total_beats = 0
+        # Draw enough durations to fill the pattern even if every pick is the shortest one,
+        # then cut the batch where the running total reaches the end of the pattern.
+        durations = self.rng.choices(COMPLEX_RHYTHM_DURATIONS, k=math.ceil(total_beats / min(COMPLEX_RHYTHM_DURATIONS)))
+        elapsed = list(itertools.accumulate(durations))
+        cut = bisect.bisect_left(elapsed, total_beats)
+        rhythm_pattern = durations[:cut]
+        remainder = total_beats - (elapsed[cut - 1] if cut else 0)
+        if remainder > 0:
+            rhythm_pattern.append(remainder)
         return rhythm_pattern
 
 class MelodyGenerator:
-    def __init__(self, scale_notes, rhythm_pattern, complexity=1, octave_range=(3, 5)):
+    def __init__(self, scale_notes, rhythm_pattern, complexity=1, octave_range=(3, 5), rng=None):
         self.scale_notes = scale_notes
         self.rhythm_pattern = rhythm_pattern
         self.complexity = complexity
         self.octave_range = octave_range
+        self.rng = rng if rng is not None else random
+        lowest_note, highest_note = octave_range[0] * 12, octave_range[1] * 12
+        self._notes_in_range = tuple(n for n in scale_notes if lowest_note <= n <= highest_note)
+        self._in_range_set = frozenset(self._notes_in_range)
         self.melody = self.generate_melody()
 
     def generate_melody(self):
+        if self.complexity == 1:
+            # Notes are independent of each other here, so draw them all in one call.
+            notes = self.rng.choices(self._notes_in_range, k=len(self.rhythm_pattern))
+            start_times = itertools.accumulate(self.rhythm_pattern, initial=0)
+            return [{'notes': (note,), 'duration': duration, 'velocity': 64, 'start_time': start_time}
+                    for note, duration, start_time in zip(notes, self.rhythm_pattern, start_times)]
+
         melody = []
         current_time = 0
         previous_note = None
         for duration in self.rhythm_pattern:
             note = self.select_note(previous_note)
-            event = {'note': note, 'duration': duration, 'velocity': 64, 'start_time': current_time}
+            event = {'notes': (note,), 'duration': duration, 'velocity': 64, 'start_time': current_time}
             melody.append(event)
             current_time += duration
             previous_note = note
         return melody
 
     def select_note(self, previous_note):
-        notes_in_range = [n for n in self.scale_notes if self.octave_range[0]*12 <= n <= self.octave_range[1]*12]
         if self.complexity == 1:
-            return random.choice(notes_in_range)
+            return self.rng.choice(self._notes_in_range)
         else:
             # Implement more complex note selection
             if previous_note:
-                step = random.choice([-2, -1, 1, 2])
+                step = self.rng.choice(MELODY_STEPS)
                 new_note = previous_note + step
-                if new_note in notes_in_range:
+                if new_note in self._in_range_set:
                     return new_note
-            return random.choice(notes_in_range)
+            return self.rng.choice(self._notes_in_range)
 
 class ChordProgressionGenerator:
     def __init__(self, scale_notes, progression_pattern, rhythm_pattern, chord_size=3):
@@ -148,20 +177,21 @@ class ChordProgressionGenerator:
         self.chords = self.generate_chord_progression()
 
     def generate_chord_progression(self):
-        chords = []
-        current_time = 0
         scale_length = len(self.scale_notes)
-        progression = self.progression_pattern.copy()
-        progression_index = 0
-        for duration in self.rhythm_pattern:
-            degree = progression[progression_index % len(progression)]
-            progression_index += 1
-            root_index = (degree - 1) % scale_length
-            chord_notes = [self.scale_notes[(root_index + i * 2) % scale_length] for i in range(self.chord_size)]
-            event = {'notes': chord_notes, 'duration': duration, 'velocity': 64, 'start_time': current_time}
-            chords.append(event)
-            current_time += duration
-        return chords
+        progression = self.progression_pattern
+        progression_length = len(progression)
+        # A progression only uses a handful of degrees, so work out each chord's notes once up front.
+        chord_offsets = range(0, self.chord_size * 2, 2)
+        chords_by_degree = {
+            degree: tuple(self.scale_notes[((degree - 1) + offset) % scale_length] for offset in chord_offsets)
+            for degree in set(progression)
+        }
+        start_times = itertools.accumulate(self.rhythm_pattern, initial=0)
+        return [
+            {'notes': chords_by_degree[progression[index % progression_length]], 'duration': duration,
+             'velocity': 64, 'start_time': start_time}
+            for index, (duration, start_time) in enumerate(zip(self.rhythm_pattern, start_times))
+        ]
 
 class BassLineGenerator:
     def __init__(self, chord_progression, time_signature, bass_octave=2):
@@ -171,17 +201,16 @@ class BassLineGenerator:
         self.bass_line = self.generate_bass_line()
 
     def generate_bass_line(self):
-        bass_line = []
-        for chord in self.chord_progression:
-            root_note = chord['notes'][0] - (12 * (self.bass_octave - 1))
-            event = {
-                'note': root_note,
+        octave_shift = 12 * (self.bass_octave - 1)
+        return [
+            {
+                'notes': (chord['notes'][0] - octave_shift,),
                 'duration': chord['duration'],
                 'velocity': 64,
                 'start_time': chord['start_time']
             }
-            bass_line.append(event)
-        return bass_line
+            for chord in self.chord_progression
+        ]
 
 # MIDI File Handling
 class MIDIFileCreator:
@@ -190,30 +219,47 @@ class MIDIFileCreator:
         self.time_signature = time_signature
         self.mid = MidiFile()
         self.ticks_per_beat = self.mid.ticks_per_beat
+        self._tempo_us = mido.bpm2tempo(tempo)
+        self._beats_per_measure, self._beat_unit = parse_time_signature(time_signature)
 
     def create_track(self, events, instrument, is_drum=False):
-        track = MidiTrack()
-        self.mid.tracks.append(track)
-        track.append(MetaMessage('set_tempo', tempo=mido.bpm2tempo(self.tempo), time=0))
-        beats_per_measure, beat_unit = map(int, self.time_signature.split('/'))
-        track.append(MetaMessage('time_signature', numerator=beats_per_measure, denominator=beat_unit, time=0))
+        messages = [
+            MetaMessage('set_tempo', tempo=self._tempo_us, time=0),
+            MetaMessage('time_signature', numerator=self._beats_per_measure, denominator=self._beat_unit, time=0),
+        ]
         if not is_drum:
-            track.append(Message('program_change', program=instrument, time=0))
-        previous_time = 0
-        events.sort(key=lambda x: x['start_time'])
-        for event in events:
-            delta_time = int((event['start_time'] - previous_time) * self.ticks_per_beat)
-            delta_time = max(delta_time, 0)
-            channel = 9 if is_drum else 0
-            track.append(Message('note_on', note=event['note'], velocity=event['velocity'], time=delta_time, channel=channel))
-            note_duration = int(event['duration'] * self.ticks_per_beat)
-            track.append(Message('note_off', note=event['note'], velocity=0, time=note_duration, channel=channel))
-            previous_time = event['start_time'] + event['duration']
+            messages.append(Message('program_change', program=instrument, time=0))
+        channel = 9 if is_drum else 0
+        events.sort(key=itemgetter('start_time'))
+        # Read each field out of the event dicts once and emit from the resulting columns.
+        # Events built outside the generators may still use the single-note {'note': n} shape.
+        notes = [event['notes'] if 'notes' in event else (event['note'],) for event in events]
+        velocities = [event['velocity'] for event in events]
+        start_times = [event['start_time'] for event in events]
+        durations = [event['duration'] for event in events]
+        end_times = [start_time + duration for start_time, duration in zip(start_times, durations)]
+        ticks_per_beat = self.ticks_per_beat
+        delta_ticks = [max(int((start_time - previous_time) * ticks_per_beat), 0)
+                       for start_time, previous_time in zip(start_times, itertools.chain((0,), end_times))]
+        duration_ticks = [int(duration * ticks_per_beat) for duration in durations]
+        append = messages.append
+        for event_notes, velocity, delta_time, note_duration in zip(notes, velocities, delta_ticks, duration_ticks):
+            # Every note of an event sounds together, so only the first on/off message carries the delta.
+            for note in event_notes:
+                append(Message('note_on', note=note, velocity=velocity, time=delta_time, channel=channel))
+                delta_time = 0
+            for note in event_notes:
+                append(Message('note_off', note=note, velocity=0, time=note_duration, channel=channel))
+                note_duration = 0
+        track = MidiTrack(messages)
+        self.mid.tracks.append(track)
         return track
 
     def save(self, output_dir, filename):
         ensure_dir(output_dir)
-        self.mid.save(os.path.join(output_dir, filename))
+        # mido issues several small writes per chunk; buffer them so a typical file reaches disk in one call.
+        with open(os.path.join(output_dir, filename), 'wb', buffering=1 << 16) as output_file:
+            self.mid.save(file=output_file)
 
 # GUI Application
 class MusicGeneratorApp: